@@ -227,9 +227,40 @@ USE_LLM = os.environ.get('USE_LLM', 'true').lower() in ('true', '1', 'yes', 'on'
 
 # Semantic Matching Configuration
 EMBEDDING_MODEL = os.environ.get('EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+# Optional directory for a persistent embedding cache (requires `pip install diskcache`,
+# which is not in requirements.txt); empty = in-memory only
+EMBEDDING_CACHE_DIR = os.environ.get('EMBEDDING_CACHE_DIR', '')
+# Maximum size of that cache in bytes; least recently stored entries are evicted beyond it
+EMBEDDING_CACHE_SIZE_LIMIT = int(os.environ.get('EMBEDDING_CACHE_SIZE_LIMIT', 256 * 1024 * 1024))
+# Where the ONNX export of EMBEDDING_MODEL is saved and reused across restarts; empty = export every start
+ONNX_MODEL_DIR = os.environ.get('ONNX_MODEL_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'flashcards', 'onnx'))
+# Threads for the embedding model's intra-op pool (defaults to all cores)
+EMBEDDING_THREADS = int(os.environ.get('EMBEDDING_THREADS', os.cpu_count() or 4))
+
+# Optional tessdata directory for OCR (e.g. the faster tessdata_fast models)
+TESSDATA_DIR = os.environ.get('TESSDATA_DIR', '')
 
 # Authentication Settings
 # Set LOGIN_URL to match the app's login URL pattern
 LOGIN_URL = '/login/'  # Django defaults to '/accounts/login/' but this app uses '/login/'
 LOGIN_REDIRECT_URL = '/'  # Where to redirect after successful login
 
+
+# Logging
+# Send the flashcards app's log records to the console (Railway captures stdout/stderr)
+# Set FLASHCARDS_LOG_LEVEL=DEBUG to see per-region and per-match details
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'flashcards': {
+            'handlers': ['console'],
+            'level': os.environ.get('FLASHCARDS_LOG_LEVEL', 'INFO').upper(),
+        },
+    },
+}
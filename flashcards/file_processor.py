@@ -119,6 +119,11 @@ def extract_first_image_from_docx(file_path):
     return images[0] if images else None
 
 
+def _round_robin_matches(num_flashcards, num_images):
+    """Assign image i % num_images to flashcard i, as (flashcard_index, image_index) tuples"""
+    return [(i, i % num_images) for i in range(num_flashcards)]
+
+
 def match_images_to_flashcards(flashcards_data, image_files_list, text_content):
     """
     Match images to flashcards based on question content and image descriptions using LLM
@@ -143,7 +148,7 @@ def match_images_to_flashcards(flashcards_data, image_files_list, text_content):
         api_key = getattr(settings, 'GROQ_API_KEY', '')
         if not api_key or not isinstance(api_key, str) or api_key.strip() == '':
             print("[INFO] No Groq API key - distributing images in round-robin fashion")
-            return [(i, i % len(image_files_list)) for i in range(len(flashcards_data))]
+            return _round_robin_matches(len(flashcards_data), len(image_files_list))
         
         model = getattr(settings, 'GROQ_MODEL', 'llama-3.3-70b-versatile')
         vision_model = getattr(settings, 'GROQ_VISION_MODEL', 'llava-3.1-70b-versatile')
@@ -304,22 +309,22 @@ Return ONLY the JSON array, no additional text or explanation."""
         else:
             print(f"[WARNING] Result count mismatch: got {len(result)}, expected {len(flashcards_data)}")
             # This shouldn't happen, but fallback to round-robin
-            return [(i, i % len(image_files_list)) for i in range(len(flashcards_data))]
+            return _round_robin_matches(len(flashcards_data), len(image_files_list))
         
     except ImportError as e:
         print(f"[ERROR] Required library not installed: {str(e)}")
         print("[INFO] Install with: pip install openai")
         # Fallback: distribute images in round-robin fashion
-        return [(i, i % len(image_files_list)) for i in range(len(flashcards_data))]
+        return _round_robin_matches(len(flashcards_data), len(image_files_list))
     except json.JSONDecodeError as e:
         print(f"[ERROR] Failed to parse JSON from API response: {str(e)}")
         print(f"[DEBUG] JSON error position: {getattr(e, 'pos', 'unknown')}")
         # Fallback: distribute images in round-robin fashion
-        return [(i, i % len(image_files_list)) for i in range(len(flashcards_data))]
+        return _round_robin_matches(len(flashcards_data), len(image_files_list))
     except ValueError as e:
         print(f"[ERROR] Invalid API response format: {str(e)}")
         # Fallback: distribute images in round-robin fashion
-        return [(i, i % len(image_files_list)) for i in range(len(flashcards_data))]
+        return _round_robin_matches(len(flashcards_data), len(image_files_list))
     except Exception as e:
         error_str = str(e).lower()
         error_type = type(e).__name__
@@ -342,7 +347,7 @@ Return ONLY the JSON array, no additional text or explanation."""
             traceback.print_exc()
         
         # Fallback: distribute images in round-robin fashion
-        return [(i, i % len(image_files_list)) for i in range(len(flashcards_data))]
+        return _round_robin_matches(len(flashcards_data), len(image_files_list))
 
 
 def extract_text_from_image_ocr(file_path):
@@ -0,0 +1,73 @@
+import numpy as np
+from django.test import SimpleTestCase
+from PIL import Image
+
+from .visual_region_service import SemanticMatcher, VisualRegion, VisualRegionDetector
+
+
+class CreateRegionFromBboxTests(SimpleTestCase):
+    """VisualRegionDetector._create_region_from_bbox"""
+
+    def setUp(self):
+        self.detector = VisualRegionDetector()
+        # Busy, non-blank content so the blank-region check keeps the crop
+        rng = np.random.default_rng(0)
+        self.page_array = rng.integers(0, 256, (600, 800, 3), dtype=np.uint8)
+        self.page_image = Image.fromarray(self.page_array, 'RGB')
+
+    def test_float_bbox_with_page_array(self):
+        # PyMuPDF image blocks report float coordinates
+        region = self.detector._create_region_from_bbox(
+            (10.4, 20.6, 250.2, 180.9), self.page_image, 0, 'table', self.page_array)
+        self.assertIsNotNone(region)
+        self.assertEqual(region.bbox, (10, 20, 251, 181))
+        self.assertEqual(region.image.size, (241, 161))
+        np.testing.assert_array_equal(np.asarray(region.image), self.page_array[20:181, 10:251])
+
+    def test_float_bbox_without_page_array(self):
+        region = self.detector._create_region_from_bbox(
+            (10.4, 20.6, 250.2, 180.9), self.page_image, 0, 'table')
+        self.assertIsNotNone(region)
+        self.assertEqual(region.bbox, (10, 20, 251, 181))
+        self.assertEqual(region.image.size, (241, 161))
+
+    def test_float_bbox_is_clipped_to_page(self):
+        region = self.detector._create_region_from_bbox(
+            (-3.5, 400.2, 200.7, 600.9), self.page_image, 0, 'table', self.page_array)
+        self.assertIsNotNone(region)
+        self.assertEqual(region.bbox, (0, 400, 201, 600))
+
+
+class CandidateRegionsTests(SimpleTestCase):
+    """SemanticMatcher._candidate_regions"""
+
+    def setUp(self):
+        self.matcher = SemanticMatcher()
+        # Blocky images, like table cells with different fills
+        rng = np.random.default_rng(0)
+        cells = rng.integers(0, 256, (2, 4, 6), dtype=np.uint8)
+        self.table, self.other = (np.repeat(np.kron(c, np.ones((40, 40), np.uint8))[..., None], 3, axis=2)
+                                  for c in cells)
+
+    def region(self, pixels, page_num, bbox=(0, 0, 240, 160)):
+        return VisualRegion(bbox, page_num, 'table', 0.7, image_array=pixels.copy())
+
+    def test_repeated_image_on_later_pages_is_skipped(self):
+        regions = [self.region(self.table, 0), self.region(self.other, 0),
+                   self.region(self.table, 1, (30, 40, 270, 200)), self.region(self.table, 2)]
+        self.assertEqual(self.matcher._candidate_regions(regions), [0, 1])
+
+    def test_distinct_images_are_kept(self):
+        regions = [self.region(self.table, 0), self.region(self.other, 1)]
+        self.assertEqual(self.matcher._candidate_regions(regions), [0, 1])
+
+    def test_different_tables_on_the_same_grid_are_kept(self):
+        # Same ruling lines, different cell text: only the exact pixels tell them apart
+        first = np.full((160, 240, 3), 255, np.uint8)
+        first[::40] = first[:, ::60] = 0
+        second = first.copy()
+        # Text-sized marks with the same amount of ink per cell, in different places
+        first[8:12, 5:15] = 0
+        second[8:12, 12:22] = 0
+        regions = [self.region(first, 0), self.region(second, 1), self.region(first.copy(), 2)]
+        self.assertEqual(self.matcher._candidate_regions(regions), [0, 1])
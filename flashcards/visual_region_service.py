@@ -3,13 +3,27 @@ Visual Region Detection and Matching Service
 Detects visual regions (graphs, tables, diagrams, formulas) in documents
 and matches them to flashcard questions using semantic similarity.
 """
+import bisect
+import hashlib
+import heapq
 import io
 import json
+import logging
+import math
+import multiprocessing
+import os
+import queue
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from typing import List, Dict, Tuple, Optional
 from PIL import Image
 import numpy as np
 from django.conf import settings
 
+logger = logging.getLogger(__name__)
+
 # Try to import optional dependencies
 # OpenCV is REQUIRED for visual region detection
 try:
@@ -17,15 +31,15 @@ try:
     # Verify OpenCV is actually working by checking version
     cv2_version = cv2.__version__
     CV2_AVAILABLE = True
-    print(f"[INFO] OpenCV {cv2_version} is available and ready for visual region detection")
+    logger.info("OpenCV %s is available and ready for visual region detection", cv2_version)
 except ImportError as e:
     CV2_AVAILABLE = False
-    print(f"[ERROR] OpenCV not available - visual region detection will fail!")
-    print(f"[ERROR] Import error: {str(e)}")
-    print(f"[ERROR] Install with: pip install opencv-python-headless")
+    logger.error("OpenCV not available - visual region detection will fail!")
+    logger.error("Import error: %s", e)
+    logger.error("Install with: pip install opencv-python-headless")
 except Exception as e:
     CV2_AVAILABLE = False
-    print(f"[ERROR] OpenCV import failed: {str(e)}")
+    logger.error("OpenCV import failed: %s", e)
 
 try:
     from sentence_transformers import SentenceTransformer
@@ -34,69 +48,159 @@ except ImportError:
     SENTENCE_TRANSFORMERS_AVAILABLE = False
 
 try:
-    from sklearn.metrics.pairwise import cosine_similarity
-    SKLEARN_AVAILABLE = True
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+    from transformers import AutoTokenizer
+    ONNX_AVAILABLE = True
 except ImportError:
-    SKLEARN_AVAILABLE = False
+    ONNX_AVAILABLE = False
+
+try:
+    from scipy.optimize import linear_sum_assignment
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
+
+try:
+    import numba
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+# Embedding models by name, shared by all SemanticMatcher instances in the process
+_MODELS: Dict[str, object] = {}
+_MODEL_LOCK = threading.Lock()
+
+# Whether in-process tesserocr is used (None = not checked yet). A tesserocr handle
+# runs one image at a time and loading one reads the language model, so idle handles
+# are pooled here and each OCR call checks one out; the pool grows to the number of
+# concurrent OCR calls
+_TESS_AVAILABLE = None
+_TESS_POOL: "queue.Queue" = queue.Queue()
 
 
 class VisualRegion:
     """Represents a detected visual region in a document"""
     def __init__(self, bbox: Tuple[int, int, int, int], page_num: int, 
-                 region_type: str, confidence: float, image: Image.Image = None):
+                 region_type: str, confidence: float, image: Image.Image = None,
+                 image_array: Optional[np.ndarray] = None):
         self.bbox = bbox  # (x0, y0, x1, y1)
         self.page_num = page_num
         self.region_type = region_type  # 'table' (only table regions are used)
         self.confidence = confidence
-        self.image = image
+        self._image = image
+        self.image_array = image_array  # RGB pixels; turned into a PIL image on first access
         self.embedding = None  # Will be populated for semantic matching
+        self.ocr_useful = False  # Set by OCR when real text (not a fallback label) was found
+    
+    @property
+    def image(self) -> Optional[Image.Image]:
+        if self._image is None and self.image_array is not None:
+            self._image = Image.fromarray(self.image_array, 'RGB')
+            self.image_array = None
+        return self._image
+    
+    @image.setter
+    def image(self, image: Optional[Image.Image]):
+        self._image = image
+        self.image_array = None
+    
+    @image.deleter
+    def image(self):
+        self._image = None
+        self.image_array = None
 
 
 class VisualRegionDetector:
     """Detects visual regions in PDF/Word documents"""
     
+    # Page-level parallelism for PDFs: at most this many worker processes per document,
+    # and only for documents with at least this many pages
+    MAX_PDF_WORKERS = 2
+    MIN_PARALLEL_PDF_PAGES = 8
+    
     def __init__(self):
         self.min_region_area = 2500  # Lowered from 3000 to detect even more visual regions
         self.aspect_ratio_range = (0.2, 5.0)  # More permissive aspect ratios to catch more regions
         self.max_region_area_ratio = 0.50  # Maximum 50% of page area (stricter than before)
+        # Structuring elements for table ruling lines, built once rather than per page
+        if CV2_AVAILABLE:
+            self.horizontal_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (40, 1))
+            self.vertical_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (1, 40))
     
     def detect_regions_in_pdf(self, file_path: str) -> List[VisualRegion]:
         """Detect visual regions in a PDF document"""
         if not CV2_AVAILABLE:
-            print("[ERROR] OpenCV is required for visual region detection but is not available!")
-            print("[ERROR] Please ensure opencv-python-headless is installed: pip install opencv-python-headless")
+            logger.error("OpenCV is required for visual region detection but is not available!")
+            logger.error("Please ensure opencv-python-headless is installed: pip install opencv-python-headless")
             return []
         
-        regions = []
         try:
             import fitz  # PyMuPDF
             
             doc = fitz.open(file_path)
+            page_count = len(doc)
+            doc.close()
             
-            print(f"[INFO] Processing all {len(doc)} pages for visual region detection...")
+            logger.info("Processing all %s pages for visual region detection...", page_count)
             
-            for page_num in range(len(doc)):
+            # Pages are independent: split them into contiguous chunks, one per worker.
+            # Each worker opens its own copy of the document (fitz pages can't be pickled).
+            # Short documents aren't worth starting processes for, and the pool stays small
+            # because every web worker thread may be running one of these at the same time
+            workers = min(os.cpu_count() or 1, self.MAX_PDF_WORKERS, page_count)
+            if workers > 1 and page_count >= self.MIN_PARALLEL_PDF_PAGES:
+                step = (page_count + workers - 1) // workers
+                chunks = [range(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+                try:
+                    with ProcessPoolExecutor(max_workers=len(chunks), mp_context=_pdf_pool_context()) as pool:
+                        results = pool.map(_detect_pdf_pages, [file_path] * len(chunks), chunks)
+                        regions = [region for chunk_regions in results for region in chunk_regions]
+                    logger.info("Found %s visual regions across %s pages", len(regions), page_count)
+                    return regions
+                except Exception as e:
+                    logger.warning("Parallel page detection failed, processing pages sequentially: %s", e)
+            
+            return self._detect_regions_in_pages(file_path, range(page_count))
+            
+        except ImportError:
+            logger.warning("PyMuPDF not installed. Install with: pip install PyMuPDF")
+            return []
+        except Exception as e:
+            logger.error("Failed to detect regions in PDF: %s", e)
+            return []
+    
+    def _detect_regions_in_pages(self, file_path: str, page_nums: range) -> List[VisualRegion]:
+        """Render and detect regions on the given pages of a PDF, in page order"""
+        import fitz  # PyMuPDF
+        
+        regions = []
+        doc = fitz.open(file_path)
+        try:
+            for page_num in page_nums:
                 page = doc[page_num]
                 
+                # Text-only pages have nothing to detect; don't pay for a 2x render
+                if not self._page_has_graphics(page):
+                    logger.info("Page %s/%s: No images or drawings, skipped", page_num + 1, len(doc))
+                    continue
+                
                 # Get page as image for processing
-                pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))  # 2x zoom for better quality
-                img_data = pix.tobytes("png")
-                page_image = Image.open(io.BytesIO(img_data))
+                pix = page.get_pixmap(matrix=fitz.Matrix(2, 2), alpha=False)  # 2x zoom for better quality
+                # Wrap the raw RGB samples directly instead of a PNG encode/decode round-trip;
+                # the PIL image and the numpy array share the same buffer
+                samples = pix.samples
+                page_image = Image.frombuffer('RGB', (pix.width, pix.height), samples, 'raw', 'RGB', pix.stride, 1)
+                page_array = np.frombuffer(samples, dtype=np.uint8).reshape(pix.height, pix.stride)
+                page_array = page_array[:, :pix.width * 3].reshape(pix.height, pix.width, 3)
                 
                 # Detect regions on this page
-                page_regions = self._detect_regions_on_page(page, page_image, page_num)
+                page_regions = self._detect_regions_on_page(page, page_image, page_num, page_array)
                 regions.extend(page_regions)
-                print(f"[INFO] Page {page_num + 1}/{len(doc)}: Found {len(page_regions)} visual regions (total: {len(regions)})")
-            
+                logger.info("Page %s/%s: Found %s visual regions (total: %s)", page_num + 1, len(doc), len(page_regions), len(regions))
+        finally:
             doc.close()
-            return regions
-            
-        except ImportError:
-            print("[WARNING] PyMuPDF not installed. Install with: pip install PyMuPDF")
-            return []
-        except Exception as e:
-            print(f"[ERROR] Failed to detect regions in PDF: {str(e)}")
-            return []
+        return regions
     
     def detect_regions_in_docx(self, file_path: str) -> List[VisualRegion]:
         """Detect visual regions in a Word document"""
@@ -129,33 +233,51 @@ class VisualRegionDetector:
                     )
                     regions.append(region)
                 except Exception as e:
-                    print(f"[WARNING] Failed to process image {image_file}: {str(e)}")
+                    logger.warning("Failed to process image %s: %s", image_file, e)
                     continue
             
             docx_zip.close()
             return regions
             
         except Exception as e:
-            print(f"[ERROR] Failed to detect regions in Word document: {str(e)}")
+            logger.error("Failed to detect regions in Word document: %s", e)
             return []
     
-    def _detect_regions_on_page(self, page, page_image: Image.Image, page_num: int) -> List[VisualRegion]:
-        """Detect visual regions on a single page using layout analysis"""
+    def _page_has_graphics(self, page) -> bool:
+        """Whether a PDF page has any embedded images or vector drawings"""
+        try:
+            if page.get_images():
+                return True
+            # get_cdrawings skips building Python Rect/Point objects (newer PyMuPDF only)
+            get_drawings = getattr(page, 'get_cdrawings', None) or page.get_drawings
+            return bool(get_drawings())
+        except Exception:
+            # If in doubt, render and analyse the page
+            return True
+    
+    def _detect_regions_on_page(self, page, page_image: Image.Image, page_num: int,
+                                page_array: Optional[np.ndarray] = None) -> List[VisualRegion]:
+        """
+        Detect visual regions on a single page using layout analysis
+        page_array, when given, is a numpy view of page_image's pixels
+        """
         regions = []
         
         if not CV2_AVAILABLE:
             # Don't create entire page regions - return empty if OpenCV not available
-            print(f"[WARNING] OpenCV not available, cannot detect regions on page {page_num + 1}")
+            logger.warning("OpenCV not available, cannot detect regions on page %s", page_num + 1)
             return []
         
         try:
             
             # Convert PIL to OpenCV format
-            img_array = np.array(page_image)
+            img_array = page_array if page_array is not None else np.asarray(page_image)
             if len(img_array.shape) == 3:
                 gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
             else:
                 gray = img_array
+            # Regions are cut as array slices when the page is plain RGB
+            rgb_array = img_array if img_array.ndim == 3 and img_array.shape[2] == 3 else None
             
             # Method 1: Detect using PyMuPDF's block detection
             try:
@@ -163,7 +285,7 @@ class VisualRegionDetector:
                 for block in blocks:
                     if "image" in block:  # Image block
                         bbox = block["bbox"]  # (x0, y0, x1, y1)
-                        region = self._create_region_from_bbox(bbox, page_image, page_num, "table")
+                        region = self._create_region_from_bbox(bbox, page_image, page_num, "table", rgb_array)
                         if region:
                             regions.append(region)
             except:
@@ -179,55 +301,78 @@ class VisualRegionDetector:
                 
                 page_area = gray.shape[1] * gray.shape[0]  # width * height
                 
-                for contour in contours:
-                    x, y, w, h = cv2.boundingRect(contour)
+                for x, y, w, h in self._filter_contour_rects(contours, page_area, check_aspect=True):
                     area = w * h
                     
-                    # Filter by size
-                    if area < self.min_region_area:
-                        continue
-                    
-                    # CRITICAL: Reject contours that are too large (likely entire page or large sections)
-                    # STRICT: Reject if covering more than 50% of page (reduced from 80%)
-                    region_ratio = area / page_area if page_area > 0 else 0
-                    if region_ratio > 0.50:  # Reduced from 0.80 to 0.50
-                        print(f"[DEBUG] Rejected contour covering {region_ratio*100:.1f}% of page (max 50% allowed)")
-                        continue
-                    
-                    # Check aspect ratio
-                    aspect_ratio = w / h if h > 0 else 0
-                    if not (self.aspect_ratio_range[0] <= aspect_ratio <= self.aspect_ratio_range[1]):
-                        continue
-                    
                     # Determine region type based on characteristics
                     region_type = self._classify_region_type(w, h, area, gray[y:y+h, x:x+w])
                     
                     bbox = (x, y, x + w, y + h)
-                    region = self._create_region_from_bbox(bbox, page_image, page_num, region_type)
+                    region = self._create_region_from_bbox(bbox, page_image, page_num, region_type, rgb_array)
                     if region:
                         regions.append(region)
             except Exception as e:
-                print(f"[WARNING] Contour detection failed: {str(e)}")
+                logger.warning("Contour detection failed: %s", e)
             
             # Method 3: Detect tables using horizontal/vertical lines
             try:
-                table_regions = self._detect_tables(gray, page_image, page_num)
+                table_regions = self._detect_tables(gray, page_image, page_num, rgb_array)
                 regions.extend(table_regions)
             except Exception as e:
-                print(f"[WARNING] Table detection failed: {str(e)}")
+                logger.warning("Table detection failed: %s", e)
             
-            return regions
+            # The three methods often find the same table; keep one copy of each
+            return self._suppress_overlapping_regions(regions)
             
         except Exception as e:
-            print(f"[WARNING] Region detection failed: {str(e)}")
+            logger.warning("Region detection failed: %s", e)
+            return []
+    
+    def _filter_contour_rects(self, contours, page_area: int, check_aspect: bool) -> List[Tuple[int, int, int, int]]:
+        """
+        Bounding rects (x, y, w, h) of the contours worth turning into regions
+        Size, page-coverage and aspect filters run on all rects at once, so the
+        thousands of small text contours on a page never reach a Python loop
+        """
+        if not contours:
             return []
+        rects = np.array([cv2.boundingRect(c) for c in contours], dtype=np.int64)
+        w, h = rects[:, 2], rects[:, 3]
+        area = w * h
+        keep = area >= self.min_region_area
+        
+        # CRITICAL: Reject contours that are too large (likely entire page or large sections)
+        # STRICT: Reject if covering more than 50% of page (reduced from 80%)
+        too_large = keep & (area > 0.50 * page_area) if page_area > 0 else np.zeros_like(keep)
+        if too_large.any():
+            logger.debug("Rejected %s contours covering more than 50%% of page", int(too_large.sum()))
+        keep &= ~too_large
+        
+        if check_aspect:
+            aspect_ratio = w / np.maximum(h, 1)
+            keep &= (h > 0) & (aspect_ratio >= self.aspect_ratio_range[0]) & (aspect_ratio <= self.aspect_ratio_range[1])
+        return [tuple(rect) for rect in rects[keep].tolist()]
+    
+    def _suppress_overlapping_regions(self, regions: List[VisualRegion],
+                                      iou_threshold: float = 0.5) -> List[VisualRegion]:
+        """Non-max suppression: drop regions overlapping a higher-confidence one on the same page"""
+        if len(regions) < 2:
+            return regions
+        boxes = [[x0, y0, x1 - x0, y1 - y0] for x0, y0, x1, y1 in (r.bbox for r in regions)]
+        scores = [float(r.confidence) for r in regions]
+        keep = cv2.dnn.NMSBoxes(boxes, scores, score_threshold=0.0, nms_threshold=iou_threshold)
+        keep = sorted(np.asarray(keep, dtype=np.intp).ravel().tolist())
+        if len(keep) < len(regions):
+            logger.debug("Suppressed %s overlapping regions", len(regions) - len(keep))
+        return [regions[i] for i in keep]
     
     def _classify_region_type(self, width: int, height: int, area: int, region_gray: np.ndarray) -> str:
         """Classify the type of visual region - all regions are classified as 'table'"""
         # Always return 'table' for all visual regions
         return "table"
     
-    def _detect_tables(self, gray: np.ndarray, page_image: Image.Image, page_num: int) -> List[VisualRegion]:
+    def _detect_tables(self, gray: np.ndarray, page_image: Image.Image, page_num: int,
+                       rgb_array: Optional[np.ndarray] = None) -> List[VisualRegion]:
         """Detect table regions using line detection"""
         regions = []
         if not CV2_AVAILABLE:
@@ -235,52 +380,52 @@ class VisualRegionDetector:
         
         try:
             
-            # Detect horizontal lines
-            horizontal_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (40, 1))
-            horizontal_lines = cv2.morphologyEx(gray, cv2.MORPH_OPEN, horizontal_kernel)
-            
-            # Detect vertical lines
-            vertical_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (1, 40))
-            vertical_lines = cv2.morphologyEx(gray, cv2.MORPH_OPEN, vertical_kernel)
-            
-            # Combine
-            table_mask = cv2.addWeighted(horizontal_lines, 0.5, vertical_lines, 0.5, 0.0)
+            table_mask = self._table_line_mask(gray)
             
             # Find contours of table regions - use RETR_TREE to avoid picking up entire page
             contours, _ = cv2.findContours(table_mask, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
             
             page_area = gray.shape[1] * gray.shape[0]  # width * height
             
-            for contour in contours:
-                x, y, w, h = cv2.boundingRect(contour)
-                area = w * h
-                
-                if area < self.min_region_area:
-                    continue
-                
-                # CRITICAL: Reject contours that are too large (likely entire page or large sections)
-                # STRICT: Reject if covering more than 50% of page (reduced from 80%)
-                region_ratio = area / page_area if page_area > 0 else 0
-                if region_ratio > 0.50:  # Reduced from 0.80 to 0.50
-                    print(f"[DEBUG] Rejected table contour covering {region_ratio*100:.1f}% of page (max 50% allowed)")
-                    continue
-                
+            for x, y, w, h in self._filter_contour_rects(contours, page_area, check_aspect=False):
                 bbox = (x, y, x + w, y + h)
-                region = self._create_region_from_bbox(bbox, page_image, page_num, "table")
+                region = self._create_region_from_bbox(bbox, page_image, page_num, "table", rgb_array)
                 if region:
                     regions.append(region)
             
             return regions
             
         except Exception as e:
-            print(f"[WARNING] Table detection error: {str(e)}")
+            logger.warning("Table detection error: %s", e)
             return []
     
+    def _table_line_mask(self, gray: np.ndarray) -> np.ndarray:
+        """Horizontal and vertical ruling lines of a page, blended into one mask"""
+        # Both openings and the blend stay on the OpenCL device when one is available
+        src = cv2.UMat(gray) if cv2.ocl.haveOpenCL() else gray
+        
+        # Detect horizontal lines
+        horizontal_lines = cv2.morphologyEx(src, cv2.MORPH_OPEN, self.horizontal_kernel)
+        
+        # Detect vertical lines
+        vertical_lines = cv2.morphologyEx(src, cv2.MORPH_OPEN, self.vertical_kernel)
+        
+        # Combine
+        table_mask = cv2.addWeighted(horizontal_lines, 0.5, vertical_lines, 0.5, 0.0)
+        return table_mask.get() if isinstance(table_mask, cv2.UMat) else table_mask
+    
     def _create_region_from_bbox(self, bbox: Tuple[int, int, int, int], 
                                  page_image: Image.Image, page_num: int, 
-                                 region_type: str) -> Optional[VisualRegion]:
-        """Create a VisualRegion from bounding box"""
-        x0, y0, x1, y1 = bbox
+                                 region_type: str,
+                                 page_array: Optional[np.ndarray] = None) -> Optional[VisualRegion]:
+        """
+        Create a VisualRegion from bounding box
+        page_array, when given, is page_image's RGB pixels as an (H, W, 3) uint8 array
+        """
+        # PyMuPDF block bboxes are floats: round outwards to whole pixels so the
+        # bounds can be used as array slices
+        x0, y0 = math.floor(bbox[0]), math.floor(bbox[1])
+        x1, y1 = math.ceil(bbox[2]), math.ceil(bbox[3])
         width = x1 - x0
         height = y1 - y0
         
@@ -288,12 +433,16 @@ class VisualRegionDetector:
         if width <= 0 or height <= 0:
             return None
         
-        if x0 < 0 or y0 < 0 or x1 > page_image.width or y1 > page_image.height:
+        if page_array is not None:
+            image_height, image_width = page_array.shape[:2]
+        else:
+            image_width, image_height = page_image.width, page_image.height
+        if x0 < 0 or y0 < 0 or x1 > image_width or y1 > image_height:
             # Clamp to image bounds
             x0 = max(0, x0)
             y0 = max(0, y0)
-            x1 = min(page_image.width, x1)
-            y1 = min(page_image.height, y1)
+            x1 = min(image_width, x1)
+            y1 = min(image_height, y1)
             width = x1 - x0
             height = y1 - y0
         
@@ -308,7 +457,7 @@ class VisualRegionDetector:
         region_ratio = region_area / page_area if page_area > 0 else 0
         
         if region_ratio > 0.50:  # Reduced from 0.80 to 0.50 (50% max)
-            print(f"[DEBUG] Rejected region covering {region_ratio*100:.1f}% of page (too large, max 50% allowed)")
+            logger.debug("Rejected region covering %.1f%% of page (too large, max 50%% allowed)", region_ratio*100)
             return None
         
         # Also reject if region is very close to page dimensions (within 10% margin, stricter than before)
@@ -316,18 +465,16 @@ class VisualRegionDetector:
         height_ratio = height / page_image.height if page_image.height > 0 else 0
         
         if width_ratio > 0.90 or height_ratio > 0.90:  # Stricter: reject if >90% in either dimension
-            print(f"[DEBUG] Rejected region with dimensions {width}x{height} (width: {width_ratio*100:.1f}%, height: {height_ratio*100:.1f}% of page - too large)")
+            logger.debug("Rejected region with dimensions %sx%s (width: %.1f%%, height: %.1f%% of page - too large)", width, height, width_ratio*100, height_ratio*100)
             return None
         
         # Crop the region
         try:
-            cropped = page_image.crop((x0, y0, x1, y1))
-            
             # CRITICAL: Enforce minimum size BEFORE checking if blank
             # Lowered minimum size to detect more regions (must be at least 150x100px)
             min_width = 150
             min_height = 100
-            if cropped.width < min_width or cropped.height < min_height:
+            if width < min_width or height < min_height:
                 # Try to expand crop to minimum size while staying within page bounds
                 center_x = (x0 + x1) // 2
                 center_y = (y0 + y1) // 2
@@ -342,44 +489,56 @@ class VisualRegionDetector:
                     new_y0 = max(0, new_y1 - min_height)
                 
                 # Re-crop with expanded bounds
-                cropped = page_image.crop((new_x0, new_y0, new_x1, new_y1))
                 width = new_x1 - new_x0
                 height = new_y1 - new_y0
                 x0, y0, x1, y1 = new_x0, new_y0, new_x1, new_y1
-                print(f"[DEBUG] Expanded small region from {x1-x0}x{y1-y0} to {width}x{height}")
+                logger.debug("Expanded small region from %sx%s to %sx%s", x1-x0, y1-y0, width, height)
             
             # CRITICAL: Reject regions that are still too small after expansion
             # Lowered minimum to allow more regions (must be at least 120x80px)
-            if cropped.width < 120 or cropped.height < 80:
-                print(f"[DEBUG] Rejected region too small: {cropped.width}x{cropped.height} (minimum: 120x80)")
+            if width < 120 or height < 80:
+                logger.debug("Rejected region too small: %sx%s (minimum: 120x80)", width, height)
                 return None
             
+            # With the page's pixel array, check a view of it and only copy regions that are kept
+            if page_array is not None:
+                cropped = page_array[y0:y1, x0:x1]
+            else:
+                cropped = page_image.crop((x0, y0, x1, y1))
+            
             # CRITICAL: Check if cropped region is blank/white BEFORE creating VisualRegion
             # This prevents blank regions from being matched to questions
             try:
                 import numpy as np
                 # Convert to RGB if needed
                 check_img = cropped
-                if check_img.mode != 'RGB':
+                if page_array is None and check_img.mode != 'RGB':
                     check_img = check_img.convert('RGB')
                 
                 # Check if image is mostly blank/white
-                img_array = np.array(check_img)
-                white_pixels = np.sum(np.all(img_array > 240, axis=2))
+                img_array = np.asarray(check_img)
                 total_pixels = img_array.shape[0] * img_array.shape[1]
+                if CV2_AVAILABLE:
+                    # Single SIMD passes instead of building temporary boolean/float arrays
+                    white_pixels = cv2.countNonZero(cv2.inRange(img_array, (241, 241, 241), (255, 255, 255)))
+                    means, stds = cv2.meanStdDev(img_array)
+                    # Variance over all channels, recombined from the per-channel moments
+                    variance = float(np.mean(stds ** 2 + means ** 2) - np.mean(means) ** 2)
+                else:
+                    white_pixels = np.sum(np.all(img_array > 240, axis=2))
+                    variance = np.var(img_array)
                 white_ratio = white_pixels / total_pixels if total_pixels > 0 else 0
-                variance = np.var(img_array)
                 
                 # Reject if image is >95% white OR has very low variance (<100)
                 if white_ratio > 0.95 or variance < 100:
-                    print(f"[DEBUG] Rejected blank/white region at ({x0}, {y0}, {width}x{height}) - white_ratio: {white_ratio:.2f}, variance: {variance:.1f}")
+                    logger.debug("Rejected blank/white region at (%s, %s, %sx%s) - white_ratio: %.2f, variance: %.1f", x0, y0, width, height, white_ratio, variance)
                     return None
             except ImportError:
                 # If numpy not available, skip blank check (but log warning)
-                print(f"[WARNING] numpy not available, cannot check if region is blank")
+                logger.warning("numpy not available, cannot check if region is blank")
             except Exception as e:
                 # If check fails, continue (don't reject region on check error)
-                print(f"[WARNING] Error checking if region is blank: {str(e)}")
+                logger.warning("Error checking if region is blank: %s", e)
             
             # Calculate confidence based on region characteristics
             # Prefer smaller, more specific regions (inverse relationship with size)
@@ -404,60 +563,285 @@ class VisualRegionDetector:
                 page_num=page_num,
                 region_type=region_type,
                 confidence=confidence,
-                image=cropped
+                image=cropped if page_array is None else None,
+                # Copied so the region doesn't keep the whole page buffer alive
+                image_array=cropped.copy() if page_array is not None else None
             )
             
             return region
             
         except Exception as e:
-            print(f"[WARNING] Failed to crop region: {str(e)}")
+            logger.warning("Failed to crop region: %s", e)
             return None
 
 
 class SemanticMatcher:
     """Matches visual regions to questions using semantic similarity"""
     
-    def __init__(self):
+    # Batch OCR layout: blank rows between stacked regions, and the tallest
+    # canvas handed to tesseract in one call
+    OCR_BATCH_SEPARATOR = 40
+    OCR_BATCH_MAX_HEIGHT = 30000
+    
+    # Embeddings keyed by hash of (model name, text), shared by all matcher instances;
+    # optionally backed by a diskcache store under settings.EMBEDDING_CACHE_DIR
+    EMBEDDING_CACHE_SIZE = 4096
+    # Texts per encode() call when the model runs on a GPU
+    GPU_BATCH_SIZE = 128
+    _emb_cache: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+    _emb_cache_lock = threading.Lock()
+    _emb_disk_cache = None
+    
+    # OCR text keyed by image content hash, shared by all matcher instances
+    OCR_CACHE_SIZE = 512
+    _ocr_cache: "OrderedDict[bytes, str]" = OrderedDict()
+    _ocr_cache_lock = threading.Lock()
+    
+    def __init__(self, max_ocr_dim: int = 1500):
         self.model = None
-        self._load_model()
+        self.model_name = getattr(settings, 'EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+        self.max_ocr_dim = max_ocr_dim  # Longest image side handed to OCR
+        self._use_tess = False
+        # The embedding model and OCR engine are loaded on first use, so documents
+        # without visual regions never pay for them
+        self._engines_loaded = False
+    
+    def _ensure_engines_loaded(self):
+        """Load the embedding model and OCR engine the first time they are needed"""
+        if not self._engines_loaded:
+            self._engines_loaded = True
+            self._load_model()
+            self._load_ocr_engine()
+    
+    def _load_ocr_engine(self):
+        """
+        Use in-process tesseract when tesserocr is installed
+        Handles are opened on first use and pooled (see _TESS_POOL)
+        """
+        global _TESS_AVAILABLE
+        if _TESS_AVAILABLE is None:
+            try:
+                import tesserocr  # noqa: F401
+                _TESS_AVAILABLE = True
+                logger.info("Using in-process tesserocr for OCR")
+            except ImportError:
+                _TESS_AVAILABLE = False  # pytesseract (one tesseract process per call) is used instead
+        self._use_tess = _TESS_AVAILABLE
+    
+    def _create_ocr_engine(self):
+        """Open a tesserocr API handle, or None to use pytesseract"""
+        try:
+            from tesserocr import PyTessBaseAPI, PSM, OEM
+            # LSTM engine only; the legacy engine is slower and not needed for printed text
+            tessdata_dir = getattr(settings, 'TESSDATA_DIR', '')
+            kwargs = {'path': tessdata_dir} if tessdata_dir else {}
+            tess = PyTessBaseAPI(lang='eng', psm=PSM.SINGLE_BLOCK, oem=OEM.LSTM_ONLY, **kwargs)
+            tess.SetVariable('tessedit_do_invert', '0')
+            return tess
+        except ImportError:
+            return None  # pytesseract (one tesseract process per call) is used instead
+        except Exception as e:
+            logger.warning("Failed to initialise tesserocr, using pytesseract: %s", e)
+            return None
     
     def _load_model(self):
-        """Load embedding model for semantic matching"""
+        """
+        Load embedding model for semantic matching
+        The model is loaded once per process and shared by every SemanticMatcher
+        """
+        with _MODEL_LOCK:
+            model = _MODELS.get(self.model_name)
+            if model is None:
+                model = self._create_model()
+                if model is not None:
+                    _MODELS[self.model_name] = model
+        self.model = model
+    
+    def _create_model(self):
+        """
+        Build the embedding model: sentence-transformers on a GPU when there is one,
+        else ONNX Runtime on CPU if available, else sentence-transformers on CPU
+        """
+        if ONNX_AVAILABLE and not _cuda_available():
+            # ONNX Runtime runs the same model noticeably faster on CPU than PyTorch
+            try:
+                logger.info("Loading ONNX embedding model: %s", self.model_name)
+                model = _OnnxEncoder(self.model_name, getattr(settings, 'ONNX_MODEL_DIR', ''))
+                logger.info("ONNX embedding model loaded")
+                return model
+            except Exception as e:
+                logger.warning("Failed to load ONNX embedding model, using sentence-transformers: %s", e)
         try:
             from sentence_transformers import SentenceTransformer
             
             # Use a lightweight model that works well for text-image matching
-            model_name = getattr(settings, 'EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
-            print(f"[INFO] Loading embedding model: {model_name}")
-            self.model = SentenceTransformer(model_name)
-            print("[SUCCESS] Embedding model loaded")
+            model_name = self.model_name
+            import torch
+            device = 'cuda' if torch.cuda.is_available() else 'cpu'
+            logger.info("Loading embedding model: %s on %s", model_name, device)
+            model = SentenceTransformer(model_name, device=device)
+            if device == 'cuda':
+                # Half precision doubles GPU throughput; numpy can't hold bfloat16 outputs
+                model.half()
+            else:
+                model = self._configure_torch(model)
+            logger.info("Embedding model loaded")
+            return model
             
         except ImportError:
-            print("[WARNING] sentence-transformers not installed. Install with: pip install sentence-transformers")
-            self.model = None
+            logger.warning("sentence-transformers not installed. Install with: pip install sentence-transformers")
+            return None
         except Exception as e:
-            print(f"[WARNING] Failed to load embedding model: {str(e)}")
-            print("[INFO] Falling back to round-robin matching.")
-            self.model = None
+            logger.warning("Failed to load embedding model: %s", e)
+            logger.info("Falling back to round-robin matching.")
+            return None
+    
+    def _configure_torch(self, model):
+        """Use every core for the encoder's GEMMs, and IPEX kernels when installed"""
+        import torch
+        torch.set_num_threads(getattr(settings, 'EMBEDDING_THREADS', os.cpu_count() or 4))
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            # Can only be set before torch starts its first parallel region
+            pass
+        try:
+            import intel_extension_for_pytorch as ipex
+            model[0].auto_model = ipex.optimize(model[0].auto_model.eval())
+            logger.info("Embedding model optimized with Intel Extension for PyTorch")
+        except ImportError:
+            pass
+        except Exception as e:
+            logger.warning("IPEX optimization failed, using stock PyTorch: %s", e)
+        return model
     
     def generate_embeddings(self, texts: List[str], batch_size: int = 32) -> Optional[np.ndarray]:
-        """Generate embeddings for a list of texts in batches to reduce memory usage"""
-        if not self.model:
+        """
+        Generate L2-normalized embeddings for a list of texts, reusing cached vectors
+        Vectors are stored as float16 and returned as float32
+        Only texts missing from the embedding cache go through the model
+        """
+        self._ensure_engines_loaded()
+        if not self.model or not texts:
             return None
         
+        keys = [self._embedding_cache_key(text) for text in texts]
+        vectors = [self._embedding_cache_get(key) for key in keys]
+        # Repeated texts ("Figure 1", boilerplate captions) are encoded once
+        missing = {}
+        for i, vec in enumerate(vectors):
+            if vec is None:
+                missing.setdefault(keys[i], []).append(i)
+        if missing:
+            missing_idx = [indices[0] for indices in missing.values()]
+            result = self._encode_texts([texts[i] for i in missing_idx], batch_size=batch_size)
+            if result is None:
+                return None
+            encoded, positions = result
+            # Vectors are kept as float16 (half the cache memory); fresh and cached
+            # results are rounded the same way so repeated runs score identically
+            encoded = encoded.astype(np.float16)
+            for pos, vec in zip(positions, encoded):
+                key = keys[missing_idx[pos]]
+                for i in missing[key]:
+                    vectors[i] = vec
+                self._embedding_cache_put(key, vec)
+            if len(positions) < len(missing_idx):
+                # A memory error stopped encoding early: return the leading texts that have vectors
+                logger.warning("Returning partial embeddings due to memory error")
+                vectors = vectors[:next(i for i, vec in enumerate(vectors) if vec is None)]
+                if not vectors:
+                    return None
+        
+        # Similarity math runs in float32
+        return np.stack(vectors).astype(np.float32)
+    
+    def _embedding_cache_key(self, text: str) -> bytes:
+        """Cache key for a text's embedding under the current model and backend"""
+        # ONNX Runtime and PyTorch vectors for the same model differ slightly
+        backend = 'onnx' if isinstance(self.model, _OnnxEncoder) else 'st'
+        return hashlib.sha1(f"{backend}\0{self.model_name}\0{text}".encode('utf-8')).digest()
+    
+    @classmethod
+    def _embedding_cache_get(cls, key: bytes) -> Optional[np.ndarray]:
+        """Look up a cached embedding in memory, then in the optional disk cache"""
+        with cls._emb_cache_lock:
+            vec = cls._emb_cache.get(key)
+            if vec is not None:
+                cls._emb_cache.move_to_end(key)
+                return vec
+        disk_cache = cls._get_embedding_disk_cache()
+        if disk_cache is not None:
+            try:
+                vec = disk_cache.get(key)
+            except Exception as e:
+                logger.warning("Embedding disk cache read failed: %s", e)
+                vec = None
+            if vec is not None:
+                cls._embedding_cache_put(key, vec, persist=False)
+        return vec
+    
+    @classmethod
+    def _embedding_cache_put(cls, key: bytes, vec: np.ndarray, persist: bool = True):
+        """Store an embedding in memory (LRU) and in the optional disk cache"""
+        with cls._emb_cache_lock:
+            cls._emb_cache[key] = vec
+            cls._emb_cache.move_to_end(key)
+            while len(cls._emb_cache) > cls.EMBEDDING_CACHE_SIZE:
+                cls._emb_cache.popitem(last=False)
+        disk_cache = cls._get_embedding_disk_cache() if persist else None
+        if disk_cache is not None:
+            try:
+                disk_cache.set(key, vec)
+            except Exception as e:
+                logger.warning("Embedding disk cache write failed: %s", e)
+    
+    @classmethod
+    def _get_embedding_disk_cache(cls):
+        """Open the diskcache store under settings.EMBEDDING_CACHE_DIR, if configured"""
+        if cls._emb_disk_cache is None:
+            with cls._emb_cache_lock:
+                if cls._emb_disk_cache is None:
+                    cls._emb_disk_cache = False
+                    cache_dir = getattr(settings, 'EMBEDDING_CACHE_DIR', '')
+                    if cache_dir:
+                        try:
+                            import diskcache
+                            size_limit = getattr(settings, 'EMBEDDING_CACHE_SIZE_LIMIT', 256 * 1024 * 1024)
+                            cls._emb_disk_cache = diskcache.Cache(cache_dir, size_limit=size_limit)
+                            logger.info("Using embedding disk cache at %s", cache_dir)
+                        except ImportError:
+                            logger.warning("EMBEDDING_CACHE_DIR is set but diskcache is not installed. Install with: pip install diskcache")
+                        except Exception as e:
+                            logger.warning("Failed to open embedding disk cache: %s", e)
+        # False marks "checked, not available" (an empty diskcache.Cache is also falsy)
+        return cls._emb_disk_cache if cls._emb_disk_cache is not False else None
+    
+    def _encode_texts(self, texts: List[str],
+                      batch_size: int = 32) -> Optional[Tuple[np.ndarray, List[int]]]:
+        """
+        Run the embedding model over texts in batches to reduce memory usage
+        Returns (embeddings, positions): row k of embeddings belongs to texts[positions[k]]
+        """
         try:
-            # Force garbage collection before processing
-            import gc
-            import sys
-            gc.collect()
+            # Encode texts in length order so each batch pads to similar lengths,
+            # instead of every text in a batch padding out to one long OCR string
+            order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+            texts = [texts[i] for i in order]
             
             # MEMORY OPTIMIZATION: Always process in batches to prevent memory spikes on Railway
             # Use the provided batch_size (cap regions at 10, but allow questions up to 16)
             # Questions are typically smaller in number, so can handle larger batches
             safe_batch_size = min(batch_size, 16)  # Cap at 16 to allow questions batch size of 16
+            encode_batch_size = 2  # Very small internal batch
+            if str(getattr(self.model, 'device', 'cpu')).startswith('cuda'):
+                # GPU memory is not the constraint: hand the device large batches
+                safe_batch_size = encode_batch_size = self.GPU_BATCH_SIZE
             if len(texts) > safe_batch_size:
-                print(f"[INFO] Processing {len(texts)} texts in batches of {safe_batch_size}...")
-                embeddings_list = []
+                logger.info("Processing %s texts in batches of %s...", len(texts), safe_batch_size)
+                # Batches are written straight into one float32 buffer (sized from the
+                # first batch's width), rather than collected and vstack-copied at the end
+                embeddings = None
                 for i in range(0, len(texts), safe_batch_size):
                     batch = texts[i:i + safe_batch_size]
                     try:
@@ -466,60 +850,44 @@ class SemanticMatcher:
                             batch, 
                             convert_to_numpy=True, 
                             show_progress_bar=False,
-                            batch_size=min(2, len(batch)),  # Very small internal batch
+                            batch_size=min(encode_batch_size, len(batch)),
                             normalize_embeddings=True  # Normalize to reduce memory
                         )
-                        embeddings_list.append(batch_embeddings)
+                        if embeddings is None:
+                            embeddings = np.empty((len(texts), batch_embeddings.shape[1]), dtype=np.float32)
+                        embeddings[i:i + len(batch)] = batch_embeddings
                         batch_num = i//safe_batch_size + 1
                         total_batches = (len(texts) + safe_batch_size - 1)//safe_batch_size
-                        print(f"[INFO] Processed batch {batch_num}/{total_batches}")
-                        
-                        # Aggressive memory cleanup after each batch
-                        del batch_embeddings
-                        del batch
-                        gc.collect()
+                        logger.info("Processed batch %s/%s", batch_num, total_batches)
+                        # Arrays are freed by refcount as soon as they go out of scope;
+                        # forcing a full gc sweep per batch only costs time
                         
-                        # Additional memory check - if we're running low, reduce batch size further
-                        if i > 0 and i % (safe_batch_size * 3) == 0:  # Every 3 batches
-                            # Force more aggressive cleanup
-                            gc.collect()
-                            
                     except (MemoryError, RuntimeError) as e:
-                        print(f"[ERROR] Memory error in batch {i//safe_batch_size + 1}: {str(e)}")
+                        logger.error("Memory error in batch %s: %s", i//safe_batch_size + 1, e)
                         # If we have some embeddings, return what we have
-                        if embeddings_list:
-                            print("[WARNING] Returning partial embeddings due to memory error")
-                            result = np.vstack(embeddings_list)
-                            del embeddings_list
-                            gc.collect()
-                            return result
+                        if i > 0:
+                            return embeddings[:i], order[:i]
                         raise
-                
-                # Concatenate all batches
-                embeddings = np.vstack(embeddings_list)
-                del embeddings_list
-                gc.collect()
             else:
                 # Even for small lists, use small batch size
                 embeddings = self.model.encode(
                     texts, 
                     convert_to_numpy=True, 
                     show_progress_bar=False,
-                    batch_size=min(2, len(texts)),  # Very small batch even for small lists
+                    batch_size=min(encode_batch_size, len(texts)),  # Very small batch even for small lists
                     normalize_embeddings=True
                 )
-            return embeddings
+            # Cosine scores don't need double precision; keep the similarity math in float32
+            return embeddings.astype(np.float32, copy=False), order
         except (MemoryError, RuntimeError, OSError) as e:
-            print(f"[ERROR] Failed to generate embeddings (memory/runtime error): {str(e)}")
-            import gc
-            gc.collect()
+            logger.error("Failed to generate embeddings (memory/runtime error): %s", e)
+            if isinstance(e, MemoryError):
+                # Reclaim anything stuck in reference cycles before the caller carries on
+                import gc
+                gc.collect()
             return None
         except Exception as e:
-            print(f"[ERROR] Failed to generate embeddings: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            import gc
-            gc.collect()
+            logger.exception("Failed to generate embeddings: %s", e)
             return None
     
     def match_regions_to_questions(self, regions: List[VisualRegion], 
@@ -530,205 +898,748 @@ class SemanticMatcher:
         Returns list of (question_index, region_index, similarity_score) tuples
         """
         if not regions or not questions:
-            print(f"[WARNING] No regions ({len(regions)}) or questions ({len(questions)}) to match")
+            logger.warning("No regions (%s) or questions (%s) to match", len(regions), len(questions))
             return []
         
+        self._ensure_engines_loaded()
         if not self.model:
-            print("[WARNING] Embedding model not available, no images will be displayed - semantic matching failed")
+            logger.warning("Embedding model not available, no images will be displayed - semantic matching failed")
             return []
         
         try:
             # MEMORY OPTIMIZATION: Reduce max regions to prevent OOM on Railway
             # Reduced from 50 to 40 to stay within memory limits
             MAX_SAFE_PROCESSING = 40  # Reduced from 50 to 40 for Railway memory constraints
-            if len(regions) > MAX_SAFE_PROCESSING:
-                print(f"[INFO] Large number of regions ({len(regions)}), processing top {MAX_SAFE_PROCESSING} for memory efficiency")
-                print(f"[INFO] Processing top {MAX_SAFE_PROCESSING} regions (sorted by confidence/quality)")
+            # Drop repeats of the same image before OCR + encoding; candidates holds the
+            # index into regions of each region that is actually matched
+            candidates = self._candidate_regions(regions)
+            if len(candidates) > MAX_SAFE_PROCESSING:
+                logger.info("Large number of regions (%s), processing top %s for memory efficiency", len(candidates), MAX_SAFE_PROCESSING)
+                logger.info("Processing top %s regions (sorted by confidence/quality)", MAX_SAFE_PROCESSING)
                 # Sort by confidence and take top regions for better quality
-                regions = sorted(regions, key=lambda r: r.confidence, reverse=True)[:MAX_SAFE_PROCESSING]
+                candidates = heapq.nlargest(MAX_SAFE_PROCESSING, candidates, key=lambda i: regions[i].confidence)
             else:
-                print(f"[INFO] Processing all {len(regions)} regions for semantic matching")
+                logger.info("Processing all %s regions for semantic matching", len(candidates))
+            candidate_regions = [regions[i] for i in candidates]
             
-            # Process all regions up to MAX_REGIONS limit (already limited above)
-            # No need for additional fallback - semantic matching can handle up to 50 regions
-            
-            # Extract text descriptions from regions using OCR
+            # Extract text descriptions from regions using OCR and embed them as they arrive
             # MEMORY OPTIMIZATION: Keep images for matched regions, release others after matching
-            print(f"[INFO] Extracting text from {len(regions)} regions...")
-            region_texts = []
+            logger.info("Extracting text from %s regions and generating embeddings for %s questions...", len(candidate_regions), len(questions))
             import gc
-            # Extract text but keep images for now (we'll delete unmatched ones later)
-            for idx, region in enumerate(regions):
-                text = self._extract_text_from_region(region)
-                region_texts.append(text)
-                if idx < 3:  # Log first few for debugging
-                    print(f"[DEBUG] Region {idx+1} text (first 100 chars): {text[:100]}")
-                # Periodic garbage collection for large batches
-                if idx > 0 and idx % 10 == 0:
-                    gc.collect()
-            
-            # Generate embeddings with optimized batches and aggressive error handling
-            # MEMORY OPTIMIZATION: Reduced batch sizes for Railway's memory constraints
-            print(f"[INFO] Generating embeddings for {len(questions)} questions and {len(region_texts)} regions...")
             try:
-                # Process questions first (usually small number)
-                # Keep batch size at 16 for questions
-                question_embeddings = self.generate_embeddings(questions, batch_size=16)
-                if question_embeddings is None:
-                    raise Exception("Failed to generate question embeddings")
-                
-                # Process regions with MEMORY-OPTIMIZED batch size
-                # Use batch size of 10 for all regions to prevent OOM on Railway
-                region_batch_size = 10
-                
-                print(f"[INFO] Processing {len(region_texts)} regions with batch size {region_batch_size} (estimated {len(region_texts) // region_batch_size + 1} batches)")
-                region_embeddings = self.generate_embeddings(region_texts, batch_size=region_batch_size)
+                # Extract text but keep images for now (we'll delete unmatched ones later)
+                question_embeddings, region_texts, region_embeddings, region_rows = (
+                    self._embed_questions_and_regions(questions, candidate_regions))
                 if region_embeddings is None:
                     raise Exception("Failed to generate region embeddings")
-                    
             except (MemoryError, RuntimeError, SystemExit, OSError) as e:
-                print(f"[ERROR] Memory or runtime error during embedding generation: {str(e)}")
-                print("[WARNING] Semantic matching failed due to memory/runtime constraints")
-                print("[INFO] No images will be displayed - semantic matching failed")
-                import traceback
-                traceback.print_exc()
+                logger.exception("Memory or runtime error during embedding generation: %s", e)
+                logger.warning("Semantic matching failed due to memory/runtime constraints")
+                logger.info("No images will be displayed - semantic matching failed")
                 return []
             except Exception as e:
-                print(f"[ERROR] Error during embedding generation: {str(e)}")
-                print("[INFO] No images will be displayed - semantic matching failed")
-                import traceback
-                traceback.print_exc()
+                logger.exception("Error during embedding generation: %s", e)
+                logger.info("No images will be displayed - semantic matching failed")
                 return []
+            for idx, text in enumerate(region_texts[:3]):  # Log first few for debugging
+                logger.debug("Region %s text (first 100 chars): %s", idx+1, text[:100])
             
-            # Calculate cosine similarity
-            if not SKLEARN_AVAILABLE:
-                print("[WARNING] scikit-learn not available, using manual cosine similarity")
-                # Manual cosine similarity calculation
-                def cosine_sim(a, b):
-                    return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
-                
-                similarity_matrix = np.array([
-                    [cosine_sim(q, r) for r in region_embeddings]
-                    for q in question_embeddings
-                ])
-            else:
-                similarity_matrix = cosine_similarity(question_embeddings, region_embeddings)
-            
-            # Find best matches
-            matches = []
-            used_regions = set()
+            # Calculate cosine similarity: generate_embeddings returns unit vectors,
+            # so this is one matrix multiply with no re-normalization
+            similarity_matrix = self._build_sim_matrix(question_embeddings, region_embeddings)
             
             # Log similarity scores for debugging
-            print(f"[INFO] Calculating similarity scores (min_confidence={min_confidence})...")
-            max_scores = []
-            for q_idx in range(len(questions)):
-                max_score = float(np.max(similarity_matrix[q_idx]))
-                max_scores.append(max_score)
-                if q_idx < 3:  # Log first few
-                    print(f"[DEBUG] Question {q_idx+1} max similarity: {max_score:.3f}")
+            logger.info("Calculating similarity scores (min_confidence=%s)...", min_confidence)
+            max_scores = similarity_matrix.max(axis=1).tolist()
+            for q_idx, max_score in enumerate(max_scores[:3]):  # Log first few
+                logger.debug("Question %s max similarity: %.3f", q_idx+1, max_score)
             
             # STRICT: Do not adjust threshold - require high quality matches only
             # If scores don't meet threshold, no images will be displayed (quality over quantity)
-            if max_scores and max(max_scores) < min_confidence:
-                print(f"[WARNING] Maximum similarity score {max(max_scores):.3f} is below threshold {min_confidence:.3f}")
-                print(f"[INFO] No images will be displayed - quality threshold not met (minimum {min_confidence*100:.0f}% similarity required)")
-                print(f"[INFO] This ensures only high-quality, well-matched images are shown to users")
+            best_overall = max(max_scores) if max_scores else 0.0
+            if max_scores and best_overall < min_confidence:
+                logger.warning("Maximum similarity score %.3f is below threshold %.3f", best_overall, min_confidence)
+                logger.info("No images will be displayed - quality threshold not met (minimum %.0f%% similarity required)", min_confidence*100)
+                logger.info("This ensures only high-quality, well-matched images are shown to users")
                 # Log all scores for debugging
-                if len(max_scores) <= 10:
-                    print(f"[DEBUG] All similarity scores: {[f'{s:.3f}' for s in max_scores]}")
-                else:
-                    print(f"[DEBUG] Top 10 similarity scores: {[f'{s:.3f}' for s in sorted(max_scores, reverse=True)[:10]]}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    if len(max_scores) <= 10:
+                        logger.debug("All similarity scores: %s", [f'{s:.3f}' for s in max_scores])
+                    else:
+                        logger.debug("Top 10 similarity scores: %s", [f'{s:.3f}' for s in sorted(max_scores, reverse=True)[:10]])
             
-            # Sort by similarity score (highest first)
-            for q_idx in range(len(questions)):
-                
-                best_region_idx = -1
-                best_score = min_confidence
-                
-                for r_idx in range(len(regions)):
-                    if r_idx in used_regions:
-                        continue
-                    
-                    score = float(similarity_matrix[q_idx][r_idx])
-                    if score > best_score:
-                        best_score = score
-                        best_region_idx = r_idx
-                
-                if best_region_idx >= 0:
-                    matches.append((q_idx, best_region_idx, best_score))
-                    used_regions.add(best_region_idx)
-                    print(f"[DEBUG] Matched question {q_idx+1} to region {best_region_idx+1} (score: {best_score:.3f})")
+            # Assign each question at most one region (and vice versa), then map the
+            # similarity matrix columns back to indices into regions
+            matches = [(q_idx, candidates[region_rows[col]], score)
+                       for q_idx, col, score in self._assign_regions(similarity_matrix, min_confidence)]
+            if logger.isEnabledFor(logging.DEBUG):
+                for q_idx, r_idx, score in matches:
+                    logger.debug("Matched question %s to region %s (score: %.3f)", q_idx+1, r_idx+1, score)
             
             # MEMORY OPTIMIZATION: Release images for unmatched regions only
             # Keep images for matched regions so they can be displayed
-            matched_region_indices = {r_idx for _, r_idx, _ in matches}
-            for idx, region in enumerate(regions):
-                if idx not in matched_region_indices and region.image:
-                    # Release image from memory for unmatched regions
-                    del region.image
-                    region.image = None
+            used_mask = np.zeros(len(regions), dtype=bool)
+            used_mask[[r_idx for _, r_idx, _ in matches]] = True
+            for idx in np.flatnonzero(~used_mask).tolist():
+                # Release image from memory for unmatched regions (without decoding
+                # a lazily-held pixel array into a PIL image first)
+                del regions[idx].image
             gc.collect()
             
             if not matches:
-                print(f"[WARNING] No matches found above threshold {min_confidence}")
-                print("[INFO] No images will be displayed - semantic matching failed")
+                logger.warning("No matches found above threshold %s", min_confidence)
+                logger.info("No images will be displayed - semantic matching failed")
                 return []
             
-            print(f"[INFO] Found {len(matches)} semantic matches")
+            logger.info("Found %s semantic matches", len(matches))
             return matches
             
         except Exception as e:
-            print(f"[ERROR] Semantic matching failed: {str(e)}")
-            print("[INFO] No images will be displayed - semantic matching failed")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Semantic matching failed: %s", e)
+            logger.info("No images will be displayed - semantic matching failed")
             return []
     
-    def _extract_text_from_region(self, region: VisualRegion) -> str:
-        """Extract text from a visual region using OCR"""
-        if not region.image:
-            return f"{region.region_type} visual element"
+    def _candidate_regions(self, regions: List[VisualRegion]) -> List[int]:
+        """
+        Indices of the regions worth OCR'ing and embedding: the first occurrence of
+        each exact image, so a table or figure repeated unchanged on several pages
+        (slide templates, running headers) is matched once. Overlaps within a page
+        are already merged by the detector's NMS pass
+        """
+        seen = set()
+        candidates = []
+        for idx, region in enumerate(regions):
+            key = _region_image_key(region)
+            if key is not None:
+                if key in seen:
+                    continue
+                seen.add(key)
+            candidates.append(idx)
+        if len(candidates) < len(regions):
+            logger.info("Skipping %s regions that repeat an earlier image", len(regions) - len(candidates))
+        return candidates
+    
+    def _embed_questions_and_regions(self, questions: List[str], regions: List[VisualRegion],
+                                     region_batch_size: int = 10
+                                     ) -> Tuple[np.ndarray, List[str], np.ndarray, np.ndarray]:
+        """
+        Embed the questions and the OCR text of every region, overlapping OCR with inference
+        A background thread OCRs regions into a queue while this thread embeds the
+        questions, then embeds region texts in batches as they become available
+        Returns (question_embeddings, region_texts, region_embeddings, region_rows), where
+        region_rows holds the index into regions of each row of region_embeddings
+        """
+        work = queue.Queue()  # Short strings only, so no backpressure is needed
+        stop = threading.Event()
+        
+        def produce():
+            try:
+                for item in self._iter_region_texts(regions):
+                    if stop.is_set():
+                        break
+                    work.put(item)
+            except Exception as e:
+                work.put(e)
+            finally:
+                work.put(None)
         
+        producer = threading.Thread(target=produce, name='region-ocr', daemon=True)
+        producer.start()
         try:
-            import pytesseract
+            # Process questions first (usually small number) while OCR runs
+            # Keep batch size at 16 for questions
+            question_embeddings = self.generate_embeddings(questions, batch_size=16)
+            if question_embeddings is None:
+                raise Exception("Failed to generate question embeddings")
             
-            # Convert to RGB if needed
-            img = region.image
-            if img.mode != 'RGB':
-                rgb_img = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'RGBA':
-                    rgb_img.paste(img, mask=img.split()[3])
-                else:
-                    rgb_img.paste(img)
-                img = rgb_img
+            # MEMORY OPTIMIZATION: Embed at most region_batch_size region texts at a time
+            region_texts = [None] * len(regions)
+            region_embeddings = None
+            embedded = np.zeros(len(regions), dtype=bool)
+            placeholders = []
             
-            # Extract text with better config for diagrams/graphs
-            text = pytesseract.image_to_string(img, lang='eng', config='--psm 6')
-            text = text.strip()
+            def embed(items):
+                nonlocal region_embeddings
+                for start in range(0, len(items), region_batch_size):
+                    chunk = items[start:start + region_batch_size]
+                    texts = [text for _, text in chunk]
+                    batch_embeddings = self.generate_embeddings(texts, batch_size=region_batch_size)
+                    if batch_embeddings is None or len(batch_embeddings) != len(texts):
+                        raise Exception("Failed to generate region embeddings")
+                    if region_embeddings is None:
+                        region_embeddings = np.empty((len(regions), batch_embeddings.shape[1]), dtype=np.float32)
+                    indices = [idx for idx, _ in chunk]
+                    region_embeddings[indices] = batch_embeddings
+                    embedded[indices] = True
             
-            # If OCR returns very little text, try one additional PSM mode for faster processing
-            # Reduced from 4 PSM modes to 1 for faster runtime
-            if len(text) < 10:
-                try:
-                    # Try one additional PSM mode (6 is usually best for single blocks)
-                    alt_text = pytesseract.image_to_string(img, lang='eng', config='--psm 6')
-                    if len(alt_text.strip()) > len(text.strip()):
-                        text = alt_text.strip()
-                except:
-                    pass
+            finished = False
+            while not finished:
+                # Wait for the next OCR result, then take whatever else is ready
+                batch = [work.get()]
+                while batch[-1] is not None and len(batch) < region_batch_size:
+                    try:
+                        batch.append(work.get_nowait())
+                    except queue.Empty:
+                        break
+                if batch[-1] is None:
+                    finished = True
+                    batch.pop()
+                for item in batch:
+                    if isinstance(item, Exception):
+                        raise item
                 
-                # If still no good text, create a minimal descriptive fallback
-                if len(text) < 10:
-                    text = f"{region.region_type} visual element on page {region.page_num + 1}"
+                # Fallback labels ("table visual element on page 3") embed to near-identical
+                # vectors; only embed regions where OCR found real text
+                useful = []
+                for idx, text in batch:
+                    region_texts[idx] = text
+                    if regions[idx].ocr_useful:
+                        useful.append((idx, text))
+                    else:
+                        placeholders.append((idx, text))
+                if useful:
+                    embed(useful)
             
-            return text
+            if not embedded.any() and placeholders:
+                # No region has readable text: match on the region descriptions instead
+                logger.info("No OCR text found in any region, matching on region descriptions")
+                # The labels differ only by page number, so embed one description per region type
+                indices = [idx for idx, _ in placeholders]
+                types = sorted({regions[idx].region_type for idx in indices})
+                type_embeddings = self.generate_embeddings([f"{region_type} visual element" for region_type in types],
+                                                           batch_size=region_batch_size)
+                if type_embeddings is None or len(type_embeddings) != len(types):
+                    raise Exception("Failed to generate region embeddings")
+                type_rows = {region_type: row for row, region_type in enumerate(types)}
+                region_embeddings = np.empty((len(regions), type_embeddings.shape[1]), dtype=np.float32)
+                region_embeddings[indices] = type_embeddings[[type_rows[regions[idx].region_type] for idx in indices]]
+                embedded[indices] = True
             
-        except ImportError:
-            # Fallback: create descriptive text
+            region_rows = np.flatnonzero(embedded)
+            if region_embeddings is not None:
+                region_embeddings = region_embeddings[region_rows]
+            return question_embeddings, region_texts, region_embeddings, region_rows
+        finally:
+            stop.set()
+            producer.join()
+    
+    def _iter_region_texts(self, regions: List[VisualRegion]):
+        """Yield (region_index, text) pairs as OCR results become available"""
+        if self._use_tess:
+            for idx, region in enumerate(regions):
+                yield idx, self._extract_text_from_region(region)
+        else:
+            # A single batched tesseract run returns every region at once
+            yield from enumerate(self._extract_text_batch(regions))
+    
+    def _build_sim_matrix(self, q_emb: np.ndarray, r_emb: np.ndarray) -> np.ndarray:
+        """
+        Cosine similarity (questions x regions) of unit-length embeddings as a
+        single float32 matrix multiply (both encoders normalize their output and
+        guard against zero-norm vectors there)
+        The result is a fresh C-contiguous float32 array, so per-question rows are
+        contiguous and it can be scored without another conversion
+        """
+        q = np.ascontiguousarray(q_emb, dtype=np.float32)
+        r = np.ascontiguousarray(r_emb, dtype=np.float32)
+        return q @ r.T
+    
+    def _assign_regions(self, similarity_matrix: np.ndarray,
+                        min_confidence: float) -> List[Tuple[int, int, float]]:
+        """
+        Assign regions to questions one-to-one, maximizing total similarity
+        Expects a C-contiguous float32 (questions x regions) matrix
+        Returns list of (question_index, region_index, similarity_score) tuples
+        """
+        if not SCIPY_AVAILABLE and NUMBA_AVAILABLE:
+            # Greedy fallback compiled to native code
+            q_arr, r_arr, s_arr = _greedy_match(similarity_matrix, min_confidence)
+            return sorted(zip(q_arr.tolist(), r_arr.tolist(), s_arr.tolist()))
+        
+        if not SCIPY_AVAILABLE:
+            # Greedy fallback: repeatedly take the best remaining pair, then
+            # retire its question row and region column
+            sm = similarity_matrix.copy()
+            sm[sm <= min_confidence] = -np.inf
+            n_questions, n_regions = sm.shape
+            matches = []
+            for _ in range(min(n_questions, n_regions)):
+                q_idx, r_idx = divmod(int(sm.argmax()), n_regions)
+                score = sm[q_idx, r_idx]
+                if not np.isfinite(score):
+                    break
+                matches.append((q_idx, r_idx, float(score)))
+                sm[q_idx, :] = -np.inf
+                sm[:, r_idx] = -np.inf
+            matches.sort()
+            return matches
+        
+        # Hungarian assignment (globally optimal); pairs below threshold are
+        # priced out so the solver never trades a good match for one of them
+        cost = -similarity_matrix
+        cost[similarity_matrix <= min_confidence] = 1e6
+        row_ind, col_ind = linear_sum_assignment(cost)
+        
+        scores = similarity_matrix[row_ind, col_ind]
+        keep = scores > min_confidence
+        return list(zip(row_ind[keep].tolist(), col_ind[keep].tolist(), scores[keep].tolist()))
+    
+    def _prepare_ocr_image(self, region: VisualRegion) -> Image.Image:
+        """Convert a region image to RGB (on white) and clamp its size for OCR"""
+        img = region.image
+        if img.mode != 'RGB':
+            rgb_img = Image.new('RGB', img.size, (255, 255, 255))
+            if img.mode == 'RGBA':
+                rgb_img.paste(img, mask=img.split()[3])
+            else:
+                rgb_img.paste(img)
+            img = rgb_img
+        
+        # OCR time grows with pixel count; high-DPI renders gain nothing past this size
+        if self.max_ocr_dim and max(img.size) > self.max_ocr_dim:
+            if img is region.image:
+                img = img.copy()
+            img.thumbnail((self.max_ocr_dim, self.max_ocr_dim), Image.LANCZOS)
+        return img
+    
+    def _ocr_cache_key(self, img: Image.Image) -> bytes:
+        """
+        Content hash of a region image as cropped, so cache hits skip the
+        RGB conversion and downscale as well as tesseract
+        """
+        digest = hashlib.blake2b(img.tobytes(), digest_size=16)
+        digest.update(repr((img.mode, img.size, self.max_ocr_dim)).encode())
+        return digest.digest()
+    
+    @classmethod
+    def _ocr_cache_get(cls, key: bytes) -> Optional[str]:
+        """Look up cached OCR text for an image hash"""
+        with cls._ocr_cache_lock:
+            text = cls._ocr_cache.get(key)
+            if text is not None:
+                cls._ocr_cache.move_to_end(key)
+            return text
+    
+    @classmethod
+    def _ocr_cache_put(cls, key: bytes, text: str):
+        """Store OCR text for an image hash, evicting the oldest entries"""
+        with cls._ocr_cache_lock:
+            cls._ocr_cache[key] = text
+            cls._ocr_cache.move_to_end(key)
+            while len(cls._ocr_cache) > cls.OCR_CACHE_SIZE:
+                cls._ocr_cache.popitem(last=False)
+    
+    def _ocr_skip_text(self, region: VisualRegion) -> Optional[str]:
+        """Descriptive text for regions with nothing to OCR, or None"""
+        region.ocr_useful = False
+        if not region.image:
+            return f"{region.region_type} visual element"
+        return None
+    
+    def _label_ocr_text(self, region: VisualRegion, text: Optional[str]) -> str:
+        """Turn raw OCR output into matching text, with descriptive fallbacks"""
+        region.ocr_useful = text is not None and len(text) >= 10
+        if text is None:
+            # OCR unavailable or failed: create descriptive text
             return f"{region.region_type} on page {region.page_num + 1}"
+        if len(text) < 10:
+            # If still no good text, create a minimal descriptive fallback
+            return f"{region.region_type} visual element on page {region.page_num + 1}"
+        return text
+    
+    def _extract_text_batch(self, regions: List[VisualRegion]) -> List[str]:
+        """
+        Extract text from many regions with as few tesseract runs as possible
+        Region images are stacked on a white canvas separated by blank rows,
+        OCR'd in one call, and words are assigned back to regions by y position
+        """
+        if self._use_tess:
+            # No process startup to amortize with an in-process tesseract
+            return [self._extract_text_from_region(region) for region in regions]
+        
+        try:
+            import pytesseract
+            from pytesseract import Output
+        except ImportError:
+            return [self._extract_text_from_region(region) for region in regions]
+        
+        texts = [None] * len(regions)
+        pending = []
+        duplicates = []
+        pending_keys = set()
+        for idx, region in enumerate(regions):
+            skip_text = self._ocr_skip_text(region)
+            if skip_text is not None:
+                texts[idx] = skip_text
+                continue
+            key = self._ocr_cache_key(region.image)
+            cached = self._ocr_cache_get(key)
+            if cached is not None:
+                texts[idx] = self._label_ocr_text(region, cached)
+            elif key in pending_keys:
+                duplicates.append((idx, key))
+            else:
+                pending.append((idx, self._prepare_ocr_image(region), key))
+                pending_keys.add(key)
+        
+        # Split into canvases that stay well inside tesseract's image size limit
+        canvases = []
+        current, current_height = [], 0
+        for item in pending:
+            height = item[1].height + self.OCR_BATCH_SEPARATOR
+            if current and current_height + height > self.OCR_BATCH_MAX_HEIGHT:
+                canvases.append(current)
+                current, current_height = [], 0
+            current.append(item)
+            current_height += height
+        if current:
+            canvases.append(current)
+        
+        tesseract_missing = False
+        for items in canvases:
+            if tesseract_missing:
+                for idx, _, _ in items:
+                    texts[idx] = self._label_ocr_text(regions[idx], None)
+                continue
+            width = max(img.width for _, img, _ in items)
+            height = sum(img.height for _, img, _ in items) + self.OCR_BATCH_SEPARATOR * len(items)
+            canvas = Image.new('RGB', (width, height), (255, 255, 255))
+            spans = []
+            y = 0
+            for _, img, _ in items:
+                canvas.paste(img, (0, y))
+                spans.append((y, y + img.height))
+                y += img.height + self.OCR_BATCH_SEPARATOR
+            
+            try:
+                data = pytesseract.image_to_data(canvas, lang='eng', config=_tesseract_config(),
+                                                 output_type=Output.DICT)
+            except pytesseract.TesseractNotFoundError:
+                # Per-region retries would fail the same way: use descriptive labels
+                logger.warning("Tesseract is not installed, using descriptive text for regions")
+                tesseract_missing = True
+                for idx, _, _ in items:
+                    texts[idx] = self._label_ocr_text(regions[idx], None)
+                continue
+            except Exception as e:
+                logger.warning("Batch OCR failed, falling back to per-region OCR: %s", e)
+                isolated = self._extract_text_parallel([regions[idx] for idx, _, _ in items])
+                for (idx, _, _), text in zip(items, isolated):
+                    texts[idx] = text
+                continue
+            
+            # Rebuild each region's text line by line from the word boxes
+            lines = [[] for _ in items]
+            last_line = [None] * len(items)
+            for word, top, word_height, block, par, line in zip(
+                    data['text'], data['top'], data['height'],
+                    data['block_num'], data['par_num'], data['line_num']):
+                word = word.strip()
+                if not word:
+                    continue
+                center = top + word_height // 2
+                slot = bisect.bisect_right(spans, (center, float('inf'))) - 1
+                if slot < 0 or center >= spans[slot][1]:
+                    continue  # Word fell in a separator gap
+                if last_line[slot] != (block, par, line) or not lines[slot]:
+                    lines[slot].append([])
+                    last_line[slot] = (block, par, line)
+                lines[slot][-1].append(word)
+            
+            for slot, (idx, _, key) in enumerate(items):
+                text = "\n".join(" ".join(words) for words in lines[slot]).strip()
+                self._ocr_cache_put(key, text)
+                texts[idx] = self._label_ocr_text(regions[idx], text)
+        
+        # Repeated images reuse the text OCR'd for their first occurrence
+        for idx, key in duplicates:
+            texts[idx] = self._label_ocr_text(regions[idx], self._ocr_cache_get(key))
+        
+        return texts
+    
+    def _extract_text_parallel(self, regions: List[VisualRegion]) -> List[str]:
+        """
+        Extract text from each region in isolation, spreading the tesseract
+        runs over a thread pool (one worker per CPU)
+        Each thread waits on its own tesseract process, so threads run
+        them concurrently without pickling images to worker processes
+        """
+        texts = [None] * len(regions)
+        jobs = []
+        for idx, region in enumerate(regions):
+            skip_text = self._ocr_skip_text(region)
+            if skip_text is not None:
+                texts[idx] = skip_text
+                continue
+            key = self._ocr_cache_key(region.image)
+            cached = self._ocr_cache_get(key)
+            if cached is not None:
+                texts[idx] = self._label_ocr_text(region, cached)
+                continue
+            jobs.append((idx, key, region))
+        
+        if jobs:
+            workers = min(os.cpu_count() or 1, len(jobs))
+            try:
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ocr') as pool:
+                    results = pool.map(lambda job: _ocr_image(self._prepare_ocr_image(job[2])), jobs)
+                    for (idx, key, _), text in zip(jobs, results):
+                        if text is not None:
+                            self._ocr_cache_put(key, text)
+                        texts[idx] = self._label_ocr_text(regions[idx], text)
+            except Exception as e:
+                logger.warning("Parallel OCR failed, continuing sequentially: %s", e)
+                for idx, _, _ in jobs:
+                    if texts[idx] is None:
+                        texts[idx] = self._extract_text_from_region(regions[idx])
+        
+        return texts
+    
+    def _extract_text_from_region(self, region: VisualRegion) -> str:
+        """Extract text from a visual region using OCR"""
+        skip_text = self._ocr_skip_text(region)
+        if skip_text is not None:
+            return skip_text
+        
+        # Identical images (repeated headers, logos, diagrams) are OCR'd once
+        key = self._ocr_cache_key(region.image)
+        text = self._ocr_cache_get(key)
+        if text is None:
+            # Convert to RGB if needed
+            img = self._prepare_ocr_image(region)
+            text = self._ocr_in_process(img) if self._use_tess else _ocr_image(img)
+            if text is not None:
+                self._ocr_cache_put(key, text)
+        return self._label_ocr_text(region, text)
+    
+    def _ocr_in_process(self, img: Image.Image) -> Optional[str]:
+        """Run OCR on a prepared RGB image with a pooled tesserocr handle"""
+        global _TESS_AVAILABLE
+        try:
+            tess = _TESS_POOL.get_nowait()
+        except queue.Empty:
+            tess = self._create_ocr_engine()
+            if tess is None:
+                # tesserocr can't open a handle here: use pytesseract from now on
+                _TESS_AVAILABLE = self._use_tess = False
+                return _ocr_image(img)
+        try:
+            tess.SetImage(img)
+            return tess.GetUTF8Text().strip()
         except Exception as e:
-            # Fallback: create descriptive text
-            return f"{region.region_type} on page {region.page_num + 1}"
+            logger.warning("tesserocr OCR failed: %s", e)
+            return None
+        finally:
+            _TESS_POOL.put(tess)
+
+
+class _OnnxEncoder:
+    """
+    Sentence embedding model served by ONNX Runtime.
+    Mirrors the SentenceTransformer.encode() call used by SemanticMatcher.
+    """
+    
+    # Sentence-transformers config file that holds the model's max_seq_length
+    ST_CONFIG = 'sentence_bert_config.json'
+    
+    def __init__(self, model_name: str, export_dir: str = ''):
+        # Bare sentence-transformers names live under that org on the Hugging Face hub
+        repo = model_name if '/' in model_name else f"sentence-transformers/{model_name}"
+        # The PyTorch -> ONNX export takes a while; do it once and reuse the saved copy
+        path = os.path.join(export_dir, repo.replace('/', '--')) if export_dir else ''
+        if path and os.path.isfile(os.path.join(path, 'model.onnx')):
+            self.tokenizer = AutoTokenizer.from_pretrained(path)
+            self.ort_model = ORTModelForFeatureExtraction.from_pretrained(
+                path, provider='CPUExecutionProvider'
+            )
+            self.max_seq_length = self._read_max_seq_length(path)
+        else:
+            self.tokenizer = AutoTokenizer.from_pretrained(repo)
+            self.ort_model = ORTModelForFeatureExtraction.from_pretrained(
+                repo, export=True, provider='CPUExecutionProvider'
+            )
+            self.max_seq_length = self._read_max_seq_length(repo)
+            if path:
+                self._save(path)
+    
+    def _read_max_seq_length(self, repo_or_path: str) -> int:
+        """
+        Truncation length sentence-transformers uses for this model (256 for
+        all-MiniLM-L6-v2), so both backends embed exactly the same tokens
+        """
+        try:
+            if os.path.isdir(repo_or_path):
+                config_path = os.path.join(repo_or_path, self.ST_CONFIG)
+            else:
+                from huggingface_hub import hf_hub_download
+                config_path = hf_hub_download(repo_or_path, self.ST_CONFIG)
+            with open(config_path, encoding='utf-8') as f:
+                return int(json.load(f)['max_seq_length'])
+        except Exception:
+            # No sentence-transformers config: it falls back to the tokenizer's limit too
+            return min(self.tokenizer.model_max_length, 512)
+    
+    def _save(self, path: str):
+        """Save the exported model, tokenizer and max_seq_length under path"""
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        try:
+            self.ort_model.save_pretrained(tmp_path)
+            self.tokenizer.save_pretrained(tmp_path)
+            with open(os.path.join(tmp_path, self.ST_CONFIG), 'w', encoding='utf-8') as f:
+                json.dump({'max_seq_length': self.max_seq_length}, f)
+            # Another worker may have saved it first; either copy is the same model
+            os.replace(tmp_path, path)
+            logger.info("Saved ONNX embedding model to %s", path)
+        except OSError as e:
+            if not os.path.isfile(os.path.join(path, 'model.onnx')):
+                logger.warning("Could not save ONNX embedding model to %s: %s", path, e)
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+    
+    def encode(self, texts: List[str], batch_size: int = 32,
+               normalize_embeddings: bool = True, **kwargs) -> np.ndarray:
+        chunks = []
+        for i in range(0, len(texts), max(1, batch_size)):
+            inputs = self.tokenizer(texts[i:i + batch_size], padding=True, truncation=True,
+                                    max_length=self.max_seq_length, return_tensors='np')
+            out = self.ort_model(**inputs).last_hidden_state
+            # Mean pooling over real (non-padding) tokens, as sentence-transformers does
+            mask = inputs['attention_mask'][..., None].astype(np.float32)
+            emb = (out * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            if normalize_embeddings:
+                emb /= np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12)
+            chunks.append(emb.astype(np.float32, copy=False))
+        return np.vstack(chunks)
+
+
+def _cuda_available() -> bool:
+    """Whether torch is installed and can see a CUDA device"""
+    try:
+        import torch
+        return torch.cuda.is_available()
+    except ImportError:
+        return False
+
+
+def _detect_pdf_pages(file_path: str, page_nums: range) -> List[VisualRegion]:
+    """Worker entry point: detect regions on a chunk of PDF pages"""
+    return VisualRegionDetector()._detect_regions_in_pages(file_path, page_nums)
+
+
+_PDF_POOL_CONTEXT = None
+
+
+def _pdf_pool_context():
+    """
+    Start method for the PDF page pool. Requests run in threaded web workers, and
+    forking a multi-threaded process can deadlock on locks held by other threads
+    (and duplicates the worker's loaded model), so workers come from a forkserver
+    that imports this module once and then forks clean children. Where forkserver
+    isn't available (Windows), fall back to spawn.
+    """
+    global _PDF_POOL_CONTEXT
+    if _PDF_POOL_CONTEXT is None:
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload([__name__])
+        else:
+            context = multiprocessing.get_context('spawn')
+        _PDF_POOL_CONTEXT = context
+    return _PDF_POOL_CONTEXT
+
+
+def _region_image_key(region: VisualRegion) -> Optional[bytes]:
+    """
+    Exact content hash of a region's pixels, so a table repeated unchanged on
+    several pages matches while tables with different data never do. None if
+    the region has no pixels
+    """
+    if region.image_array is not None:
+        # Hash the raw array without materializing a PIL image
+        pixels = np.ascontiguousarray(region.image_array)
+        digest = hashlib.blake2b(pixels.data, digest_size=16)
+        digest.update(repr(pixels.shape).encode())
+    elif region.image is not None:
+        image = region.image.convert('RGB')
+        digest = hashlib.blake2b(image.tobytes(), digest_size=16)
+        digest.update(repr((image.height, image.width, 3)).encode())
+    else:
+        return None
+    return digest.digest()
+
+
+def _greedy_match(sim: np.ndarray, min_conf: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Greedy one-to-one matching: repeatedly take the highest remaining score
+    above min_conf whose question and region are both still unused
+    Returns (question_indices, region_indices, scores) arrays in pick order
+    """
+    n_questions, n_regions = sim.shape
+    n_pairs = min(n_questions, n_regions)
+    q_used = np.zeros(n_questions, dtype=np.bool_)
+    r_used = np.zeros(n_regions, dtype=np.bool_)
+    q_out = np.empty(n_pairs, dtype=np.int64)
+    r_out = np.empty(n_pairs, dtype=np.int64)
+    s_out = np.empty(n_pairs, dtype=np.float32)
+    
+    n = 0
+    while n < n_pairs:
+        best_score = min_conf
+        best_q = -1
+        best_r = -1
+        for q in range(n_questions):
+            if q_used[q]:
+                continue
+            for r in range(n_regions):
+                if not r_used[r] and sim[q, r] > best_score:
+                    best_score = sim[q, r]
+                    best_q = q
+                    best_r = r
+        if best_q < 0:
+            break
+        q_used[best_q] = True
+        r_used[best_r] = True
+        q_out[n] = best_q
+        r_out[n] = best_r
+        s_out[n] = best_score
+        n += 1
+    return q_out[:n], r_out[:n], s_out[:n]
+
+
+if NUMBA_AVAILABLE:
+    _greedy_match = numba.njit(cache=True)(_greedy_match)
+
+
+# Seconds a single-region tesseract run may take before it is abandoned
+OCR_TIMEOUT = 60
+
+
+def _tesseract_config() -> str:
+    """Command-line config shared by every pytesseract call"""
+    # Single text block, LSTM engine only, and no second pass over inverted (light-on-dark) text
+    config = '--psm 6 --oem 1 -c tessedit_do_invert=0'
+    # Optionally point at the smaller/faster tessdata_fast models
+    tessdata_dir = getattr(settings, 'TESSDATA_DIR', '')
+    if tessdata_dir:
+        config += f' --tessdata-dir "{tessdata_dir}"'
+    return config
+
+
+def _ocr_image(img: Image.Image) -> Optional[str]:
+    """Run OCR on a prepared RGB region image; returns None if OCR is unavailable"""
+    try:
+        import pytesseract
+        
+        # Extract text with better config for diagrams/graphs
+        # (single PSM 6 pass; short results fall back to a descriptive label).
+        # The timeout stops a hung tesseract from holding an OCR thread forever
+        text = pytesseract.image_to_string(img, lang='eng', config=_tesseract_config(),
+                                           timeout=OCR_TIMEOUT)
+        return text.strip()
+        
+    except Exception:
+        # Missing pytesseract/tesseract or OCR error: caller uses descriptive text
+        return None
 
 
 class VisualRegionPipeline:
@@ -746,7 +1657,15 @@ class VisualRegionPipeline:
         COMPREHENSIVE ERROR HANDLING: This method will never raise exceptions, always returns a list
         """
         try:
-            print(f"[INFO] Processing document for visual region detection...")
+            # Nothing to match against: skip the (potentially slow) region detection
+            if not questions:
+                logger.info("No questions provided, skipping visual detection")
+                return []
+            if not file_path or not os.path.isfile(file_path):
+                logger.warning("Document not found for visual region detection: %s", file_path)
+                return []
+            
+            logger.info("Processing document for visual region detection...")
             
             # Detect regions with error handling
             try:
@@ -756,54 +1675,39 @@ class VisualRegionPipeline:
                                   'application/msword'] or file_path.endswith(('.docx', '.doc')):
                     regions = self.detector.detect_regions_in_docx(file_path)
                 else:
-                    print(f"[WARNING] Unsupported file type for visual region detection: {file_type}")
+                    logger.warning("Unsupported file type for visual region detection: %s", file_type)
                     return []
             except Exception as detect_err:
-                print(f"[WARNING] Error detecting regions: {type(detect_err).__name__}: {str(detect_err)}")
+                logger.warning("Error detecting regions: %s: %s", type(detect_err).__name__, detect_err)
                 return []
             
             if not regions:
-                print("[WARNING] No visual regions detected in document")
+                logger.warning("No visual regions detected in document")
                 return []
             
-            print(f"[INFO] Detected {len(regions)} visual regions")
-            
-            # MEMORY OPTIMIZATION: Reduce max regions to prevent OOM on Railway
-            # Reduced from 50 to 40 to stay within memory limits
-            MAX_SAFE_PROCESSING = 40  # Reduced from 50 to 40 for Railway memory constraints
-            if len(regions) > MAX_SAFE_PROCESSING:
-                print(f"[INFO] Large number of regions ({len(regions)}), processing top {MAX_SAFE_PROCESSING} for memory efficiency")
-                print(f"[INFO] Processing top {MAX_SAFE_PROCESSING} regions (sorted by confidence/quality)")
-                # Sort by confidence and take top regions for better quality
-                regions = sorted(regions, key=lambda r: r.confidence, reverse=True)[:MAX_SAFE_PROCESSING]
-            else:
-                print(f"[INFO] Processing all {len(regions)} detected regions for semantic matching")
+            logger.info("Detected %s visual regions", len(regions))
             
-            # Try semantic matching on the (possibly limited) regions
             # Match regions to questions with comprehensive error handling
+            # (the matcher limits how many regions it processes and returns indices into regions)
             try:
                     # Use balanced confidence threshold for quality matches
                     # Set to 0.40 (40%) - balanced threshold that ensures quality while allowing good matches
                     # Images below this threshold will not be displayed at all (strict enforcement)
                     matches = self.matcher.match_regions_to_questions(regions, questions, min_confidence=0.40)
             except (MemoryError, RuntimeError, SystemExit, OSError) as mem_err:
-                print(f"[ERROR] Memory/runtime error during matching: {type(mem_err).__name__}: {str(mem_err)}")
-                print("[INFO] No images will be displayed - semantic matching failed")
-                import traceback
-                traceback.print_exc()
+                logger.exception("Memory/runtime error during matching: %s: %s", type(mem_err).__name__, mem_err)
+                logger.info("No images will be displayed - semantic matching failed")
                 matches = []
             except Exception as match_err:
-                print(f"[ERROR] Error during semantic matching: {type(match_err).__name__}: {str(match_err)}")
-                print("[INFO] No images will be displayed - semantic matching failed")
-                import traceback
-                traceback.print_exc()
+                logger.exception("Error during semantic matching: %s: %s", type(match_err).__name__, match_err)
+                logger.info("No images will be displayed - semantic matching failed")
                 matches = []
             
             if not matches:
-                print("[WARNING] No matches found between questions and regions")
+                logger.warning("No matches found between questions and regions")
                 return []
             
-            print(f"[INFO] Matched {len(matches)} questions to visual regions")
+            logger.info("Matched %s questions to visual regions", len(matches))
             
             # Return matched regions with error handling
             try:
@@ -813,13 +1717,11 @@ class VisualRegionPipeline:
                         result.append((q_idx, regions[r_idx], score))
                 return result
             except Exception as result_err:
-                print(f"[WARNING] Error building result list: {type(result_err).__name__}: {str(result_err)}")
+                logger.warning("Error building result list: %s: %s", type(result_err).__name__, result_err)
                 return []
                 
         except Exception as outer_err:
             # Ultimate catch-all: never let this method raise an exception
-            print(f"[ERROR] Unexpected error in process_document: {type(outer_err).__name__}: {str(outer_err)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Unexpected error in process_document: %s: %s", type(outer_err).__name__, outer_err)
             return []  # Always return empty list, never raise
 
@@ -4,8 +4,18 @@ import multiprocessing
 import os
 # Railway requires using PORT environment variable
 bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
-workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = "sync"
+# Each worker loads its own embedding model, so keep the worker count small
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+# Threaded workers: requests spend most of their time waiting on tesseract
+# subprocesses and LLM HTTP calls, and threads in a worker share its model
+worker_class = "gthread"
+threads = 2
+# Split the cores between workers for torch/OpenMP so workers don't oversubscribe
+# the CPU (read by the workers, which are forked after this file runs)
+_cpu_share = str(max(1, multiprocessing.cpu_count() // workers))
+os.environ.setdefault('EMBEDDING_THREADS', _cpu_share)
+os.environ.setdefault('OMP_NUM_THREADS', _cpu_share)
+os.environ.setdefault('MKL_NUM_THREADS', _cpu_share)
 timeout = 120
 keepalive = 5
 max_requests = 1000
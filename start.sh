@@ -27,6 +27,17 @@ python manage.py migrate --noinput || {
     echo "[WARNING] Migrations failed, continuing anyway..."
 }
 
+# Each worker loads its own embedding model; 2 workers stay inside Railway's memory limit
+WORKERS="${WEB_CONCURRENCY:-2}"
+# Split the cores between workers for torch/OpenMP so they don't oversubscribe the CPU.
+# OpenMP/MKL read their thread counts once, when torch/numpy are first imported,
+# so they are set here rather than from application code
+CPU_SHARE=$(( $(nproc) / WORKERS ))
+[ "$CPU_SHARE" -ge 1 ] || CPU_SHARE=1
+export EMBEDDING_THREADS="${EMBEDDING_THREADS:-$CPU_SHARE}"
+export OMP_NUM_THREADS="${OMP_NUM_THREADS:-$CPU_SHARE}"
+export MKL_NUM_THREADS="${MKL_NUM_THREADS:-$OMP_NUM_THREADS}"
+
 echo "[INFO] Starting gunicorn server..."
 echo "[INFO] Binding to: 0.0.0.0:${PORT}"
 echo "=========================================="
@@ -35,7 +46,9 @@ echo "=========================================="
 # Railway's proxy routes to this exact port
 exec gunicorn flashcard_app.wsgi:application \
     --bind "0.0.0.0:${PORT}" \
-    --workers 2 \
+    --workers "${WORKERS}" \
+    --worker-class gthread \
+    --threads 2 \
     --timeout 600 \
     --graceful-timeout 30 \
     --keep-alive 5 \